@@ -1,5 +1,6 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
+from flask_compress import Compress
 from dotenv import load_dotenv
 import os
 import logging
@@ -18,6 +19,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from utils.json_provider import OrjsonProvider
+
 # Import blueprints
 from routes.auth import auth_bp
 from routes.claims import claims_bp
@@ -25,13 +28,22 @@ from routes.admin import admin_bp
 
 # Create Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # Configuration
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 55 * 1024 * 1024  # 5 documents x 10MB + form fields
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['SECRET_KEY'] = os.getenv('JWT_SECRET')
 
+# Compress JSON responses (claim lists compress 5-10x); tiny payloads are left alone
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -73,8 +85,8 @@ def health():
         health_status['status'] = 'degraded'
     
     try:
-        from services.ai_service import ai_service
-        if ai_service:
+        from services.ai_service import get_ai_service
+        if get_ai_service():
             health_status['ai_service'] = 'configured'
     except:
         health_status['ai_service'] = 'unavailable'
@@ -82,6 +94,13 @@ def health():
     status_code = 200 if health_status['status'] == 'healthy' else 503
     return jsonify(health_status), status_code
 
+# One-off backfill of the daily claim rollups: flask --app app rebuild-rollups
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Recompute the daily claim rollups from the claims collection"""
+    from models.database import db
+    db.rebuild_daily_rollups()
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -94,7 +113,7 @@ def internal_error(error):
 
 @app.errorhandler(413)
 def file_too_large(error):
-    return jsonify({'error': 'File too large (max 10MB)'}), 413
+    return jsonify({'error': 'Upload too large (max 5 documents of 10MB each)'}), 413
 
 @app.errorhandler(Exception)
 def handle_exception(error):
@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+# Claim endpoints spend most of their time waiting on MongoDB and Gemini,
+# so cooperative gevent workers multiplex many in-flight requests per process.
+# The gevent worker monkey-patches the stdlib before the app is imported.
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', 5000)}"
+worker_class = 'gevent'
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = 1000
+
+# Gemini calls (with retries) can take well over the default 30s
+timeout = 180
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """google-generativeai talks gRPC, which needs its own gevent hook to stay non-blocking"""
+    import grpc.experimental.gevent as grpc_gevent
+    grpc_gevent.init_gevent()
@@ -10,6 +10,7 @@ class Claim:
     
     @staticmethod
     def create(user_id, policy_number, claim_type, description, amount=0):
+        now = datetime.utcnow()
         return {
             'claim_id': Claim.generate_claim_id(),
             'user_id': user_id,
@@ -28,8 +29,8 @@ class Claim:
             'admin_notes': '',
             'rejection_reason': '',
             'approved_amount': 0,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'created_at': now,
+            'updated_at': now
         }
     
     @staticmethod
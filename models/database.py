@@ -12,6 +12,51 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
 
+# Static aggregation pipelines, built once at import instead of per call
+_HAS_TIMESTAMPS = {"$and": ["$created_at", "$approved_at"]}
+
+STATUS_COUNTS_PIPELINE = [
+    {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+]
+
+RISK_LEVEL_COUNTS_PIPELINE = [
+    {"$group": {"_id": "$ai_analysis.risk_level", "count": {"$sum": 1}}}
+]
+
+APPROVAL_STATS_PIPELINE = [
+    {"$match": {"status": "approved"}},
+    {"$group": {
+        "_id": None,
+        "total_amount": {"$sum": "$amount"},
+        "processing_ms": {"$sum": {"$cond": [
+            _HAS_TIMESTAMPS, {"$subtract": ["$approved_at", "$created_at"]}, 0
+        ]}},
+        "processed": {"$sum": {"$cond": [_HAS_TIMESTAMPS, 1, 0]}}
+    }}
+]
+
+# Daily claim count/amount (used to rebuild the daily rollups).
+# Grouped on numeric date parts (no per-document string building);
+# format the day with claims_day_key().
+CLAIMS_PER_DAY_STAGES = [
+    {"$group": {
+        "_id": {
+            "y": {"$year": "$created_at"},
+            "m": {"$month": "$created_at"},
+            "d": {"$dayOfMonth": "$created_at"}
+        },
+        "count": {"$sum": 1},
+        "total_amount": {"$sum": "$amount"}
+    }},
+    {"$sort": {"_id.y": 1, "_id.m": 1, "_id.d": 1}}
+]
+
+
+def claims_day_key(day):
+    """Format a CLAIMS_PER_DAY_STAGES group key as YYYY-MM-DD."""
+    return f"{day['y']:04d}-{day['m']:02d}-{day['d']:02d}"
+
+
 def serialize_doc(doc):
     """Convert MongoDB ObjectId to string for JSON compatibility."""
     if not doc:
@@ -39,11 +84,21 @@ class Database:
             self.users = self.db["users"]
             self.claims = self.db["claims"]
             self.notifications = self.db["notifications"]
+            # Per-day claim count/amount keyed by "YYYY-MM-DD", maintained on insert.
+            # Backfill claims that predate it with `flask --app app rebuild-rollups`.
+            self.claim_daily_rollups = self.db["claim_daily_rollups"]
 
             # Indexes
             self.users.create_index("email", unique=True)
+            # Newest-first admin user listing
+            self.users.create_index([("created_at", -1)])
             self.claims.create_index("claim_id", unique=True)
-            self.claims.create_index("user_id")
+            # Covers user_id lookups and the newest-first per-user sort
+            self.claims.create_index([("user_id", 1), ("created_at", -1)])
+            # Newest-first listing and the analytics date-range $match
+            self.claims.create_index([("created_at", -1)])
+            # Status filters (approval stats, filtered listings) with newest-first order
+            self.claims.create_index([("status", 1), ("created_at", -1)])
 
             logging.info("✅ Connected to MongoDB successfully!")
 
@@ -57,31 +112,110 @@ class Database:
         user = self.users.find_one({"email": email})
         return serialize_doc(user)
 
+    def get_user_by_id(self, user_id):
+        if not ObjectId.is_valid(user_id):
+            return None
+        user = self.users.find_one({"_id": ObjectId(user_id)})
+        return serialize_doc(user)
+
     def create_user(self, user_data):
-        user_data["created_at"] = datetime.utcnow()
+        user_data.setdefault("created_at", datetime.utcnow())
         result = self.users.insert_one(user_data)
         return str(result.inserted_id)
 
+    def create_users(self, users_data):
+        """Insert several users in one round-trip; returns their ids in order."""
+        now = datetime.utcnow()
+        for user_data in users_data:
+            user_data.setdefault("created_at", now)
+        result = self.users.insert_many(users_data)
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    def update_user(self, user_id, update_data):
+        result = self.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": update_data}
+        )
+        return result.modified_count > 0
+
+    def get_users_page(self, skip=0, limit=100):
+        """One page of users (newest first, no password hashes) plus the total count."""
+        pipeline = [
+            {"$sort": {"created_at": -1}},
+            {"$facet": {
+                "rows": [{"$skip": skip}, {"$limit": limit}, {"$project": {"password": 0}}],
+                "total": [{"$count": "n"}]
+            }}
+        ]
+        result = next(self.users.aggregate(pipeline), {"rows": [], "total": []})
+        total = result["total"][0]["n"] if result["total"] else 0
+        return result["rows"], total
+
     # ------------------- CLAIM OPERATIONS -------------------
 
     def create_claim(self, claim_data):
-        claim_data["created_at"] = datetime.utcnow()
+        claim_data.setdefault("created_at", datetime.utcnow())
         result = self.claims.insert_one(claim_data)
+        self._record_daily_rollups([claim_data])
         return str(result.inserted_id)
 
+    def create_claims(self, claims_data):
+        """Insert several claims in one round-trip; returns their ids in order."""
+        now = datetime.utcnow()
+        for claim_data in claims_data:
+            claim_data.setdefault("created_at", now)
+        result = self.claims.insert_many(claims_data)
+        self._record_daily_rollups(claims_data)
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    def _record_daily_rollups(self, claims_data):
+        """Fold newly inserted claims into their days' rollups (one upsert per day)."""
+        days = {}
+        for claim_data in claims_data:
+            day = days.setdefault(claim_data["created_at"].strftime("%Y-%m-%d"), {"count": 0, "total_amount": 0})
+            day["count"] += 1
+            day["total_amount"] += claim_data.get("amount", 0)
+
+        for key, totals in days.items():
+            self.claim_daily_rollups.update_one({"_id": key}, {"$inc": totals}, upsert=True)
+
+    def rebuild_daily_rollups(self):
+        """
+        Recompute every daily rollup from the claims collection.
+        Idempotent (per-day $set upserts, no delete-then-insert window), so a re-run
+        or an overlapping run converges on the same result.
+        """
+        days = []
+        for row in self.claims.aggregate(CLAIMS_PER_DAY_STAGES):
+            key = claims_day_key(row["_id"])
+            self.claim_daily_rollups.update_one(
+                {"_id": key},
+                {"$set": {"count": row["count"], "total_amount": row["total_amount"]}},
+                upsert=True
+            )
+            days.append(key)
+        # Days that no longer have any claims
+        self.claim_daily_rollups.delete_many({"_id": {"$nin": days}})
+        logging.info(f"Rebuilt {len(days)} daily claim rollups")
+
     def get_claim_by_id(self, claim_id):
         claim = self.claims.find_one({"claim_id": claim_id})
         return serialize_doc(claim)
 
-    def get_claims_by_user(self, user_id):
-        claims = list(self.claims.find({"user_id": user_id}).sort("created_at", -1))
+    def get_claims_by_user(self, user_id, projection=None):
+        claims = list(self.claims.find({"user_id": user_id}, projection).sort("created_at", -1))
         return [serialize_doc(c) for c in claims]
 
-    def get_all_claims(self, filters=None):
+    def get_all_claims(self, filters=None, projection=None):
         query = filters if filters else {}
-        claims = list(self.claims.find(query).sort("created_at", -1))
+        claims = list(self.claims.find(query, projection).sort("created_at", -1))
         return [serialize_doc(c) for c in claims]
 
+    def iter_all_claims(self, filters=None, projection=None, batch_size=200):
+        """Lazily yield claims (newest first) without materializing the result set."""
+        cursor = self.claims.find(filters or {}, projection).sort("created_at", -1).batch_size(batch_size)
+        return (serialize_doc(c) for c in cursor)
+
     def update_claim(self, claim_id, update_data):
         update_data["updated_at"] = datetime.utcnow()
         result = self.claims.update_one(
@@ -93,16 +227,65 @@ class Database:
     # ------------------- STATISTICS -------------------
 
     def get_claim_statistics(self):
-        total = self.claims.count_documents({})
-        approved = self.claims.count_documents({"status": "approved"})
-        pending = self.claims.count_documents({"status": "pending"})
-        rejected = self.claims.count_documents({"status": "rejected"})
+        counts = {
+            row["_id"]: row["count"]
+            for row in self.claims.aggregate(STATUS_COUNTS_PIPELINE)
+        }
+
+        return {
+            "total": sum(counts.values()),
+            "approved": counts.get("approved", 0),
+            "pending": counts.get("pending", 0),
+            "rejected": counts.get("rejected", 0)
+        }
+
+    @staticmethod
+    def _fraud_distribution(rows):
+        counts = {row["_id"]: row["count"] for row in rows}
+        return {
+            "low": counts.get("LOW", 0),
+            "medium": counts.get("MEDIUM", 0),
+            "high": counts.get("HIGH", 0)
+        }
+
+    @staticmethod
+    def _approval_statistics(rows):
+        stats = rows[0] if rows else {}
+        return {
+            "total_amount": stats.get("total_amount", 0),
+            "processing_seconds": stats.get("processing_ms", 0) / 1000,
+            "processed": stats.get("processed", 0)
+        }
+
+    def get_fraud_distribution(self):
+        """Claim counts per AI risk level in one $group pass"""
+        return self._fraud_distribution(self.claims.aggregate(RISK_LEVEL_COUNTS_PIPELINE))
+
+    def get_approval_statistics(self):
+        """Approved amount total plus processing time over claims with both timestamps"""
+        return self._approval_statistics(list(self.claims.aggregate(APPROVAL_STATS_PIPELINE)))
+
+    def get_daily_rollups(self, since):
+        """Per-day claim count/amount from the day of `since` onwards, oldest first."""
+        return list(self.claim_daily_rollups.find(
+            {"_id": {"$gte": since.strftime("%Y-%m-%d")}}
+        ).sort("_id", 1))
+
+    def get_analytics_summary(self, since):
+        """
+        Daily claims from the day of `since` (read from the rollups), plus fraud
+        distribution and approval statistics from a single $facet aggregation.
+        """
+        pipeline = [{"$facet": {
+            "risk_levels": RISK_LEVEL_COUNTS_PIPELINE,
+            "approvals": APPROVAL_STATS_PIPELINE
+        }}]
+        result = next(self.claims.aggregate(pipeline))
 
         return {
-            "total": total,
-            "approved": approved,
-            "pending": pending,
-            "rejected": rejected
+            "claims_over_time": self.get_daily_rollups(since),
+            "fraud_distribution": self._fraud_distribution(result["risk_levels"]),
+            "approval_statistics": self._approval_statistics(result["approvals"])
         }
 
 
@@ -1,12 +1,21 @@
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from datetime import datetime
 
+# Argon2id with the OWASP minimum profile (19 MiB, 2 passes) - cheaper per
+# login than werkzeug's default scrypt while still memory-hard
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# Verified against when the email is unknown so a miss costs as much as a wrong password
+_DUMMY_HASH = password_hasher.hash('dummy-password-for-timing')
+
 class User:
     @staticmethod
     def create(email, password, name, role='customer'):
         return {
             'email': email,
-            'password': generate_password_hash(password),
+            'password': User.hash_password(password),
             'name': name,
             'role': role,  # 'customer' or 'admin'
             'phone': '',
@@ -14,14 +23,37 @@ class User:
             'is_active': True
         }
     
+    @staticmethod
+    def hash_password(password):
+        return password_hasher.hash(password)
+    
     @staticmethod
     def verify_password(stored_password, provided_password):
+        if stored_password.startswith('$argon2'):
+            try:
+                return password_hasher.verify(stored_password, provided_password)
+            except (VerificationError, InvalidHashError):
+                return False
+        # Legacy werkzeug (pbkdf2/scrypt) hashes
         return check_password_hash(stored_password, provided_password)
     
+    @staticmethod
+    def verify_dummy_password(provided_password):
+        """Burn the same CPU as a real check when the user does not exist"""
+        User.verify_password(_DUMMY_HASH, provided_password)
+        return False
+    
+    @staticmethod
+    def needs_rehash(stored_password):
+        """True for legacy werkzeug hashes or argon2 hashes with outdated parameters"""
+        if not stored_password.startswith('$argon2'):
+            return True
+        return password_hasher.check_needs_rehash(stored_password)
+    
     @staticmethod
     def to_dict(user):
         """Convert user object to safe dict (remove password)"""
         user_dict = dict(user)
         user_dict.pop('password', None)
         user_dict['_id'] = str(user_dict.get('_id', ''))
-        return user_dict
\ No newline at end of file
+        return user_dict
@@ -1,9 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from models.database import db
+from utils.helpers import error_response
 from models.claim import Claim
 from routes.auth import token_required
 from datetime import datetime, timedelta
 from functools import wraps  # ✅ CRITICAL: Must be imported
+from collections import Counter, defaultdict
+from threading import Lock
+from cachetools import TTLCache
+from werkzeug.http import quote_etag
+import hashlib
+import time
 import logging
 
 admin_bp = Blueprint('admin', __name__)
@@ -18,11 +25,74 @@ def admin_required(f):
     def decorated_function(current_user, *args, **kwargs):
         if current_user.get('role') != 'admin':
             logger.warning(f"Non-admin access attempt by: {current_user.get('email')}")
-            return jsonify({'error': 'Admin access required'}), 403
+            return error_response('Admin access required', 403)
         return f(current_user, *args, **kwargs)
     return decorated_function
 
 
+# Heavy AI sub-documents left out of list views (served by the detail endpoint)
+CLAIM_LIST_PROJECTION = {
+    'ai_analysis.extracted_data': 0,
+    'ai_analysis.narrative_validation': 0,
+    'ai_analysis.tampering_check': 0
+}
+
+
+# Admin user listing page size (?limit= is clamped to the max)
+USERS_PAGE_DEFAULT_LIMIT = 100
+USERS_PAGE_MAX_LIMIT = 500
+
+
+# Analytics are aggregated over every claim and the dashboard polls them,
+# so results are reused for a short window and tagged for conditional GETs
+ANALYTICS_CACHE_TTL_SECONDS = 45
+_analytics_cache = TTLCache(maxsize=1, ttl=ANALYTICS_CACHE_TTL_SECONDS)
+_analytics_cache_lock = Lock()
+
+
+# Only the fields the analytics fallback paths read
+ANALYTICS_FALLBACK_PROJECTION = {
+    'created_at': 1,
+    'approved_at': 1,
+    'amount': 1,
+    'status': 1,
+    'ai_analysis.risk_level': 1
+}
+
+
+def invalidate_analytics_cache():
+    with _analytics_cache_lock:
+        _analytics_cache.clear()
+
+
+def _etag_matches(etag):
+    """
+    If-None-Match check that also accepts the compressed variants of `etag`:
+    Flask-Compress rewrites strong ETags to "<tag>:gzip" / "<tag>:br" and clients send those back
+    """
+    if_none_match = request.if_none_match
+    return etag in if_none_match or any(
+        f"{etag}:{algorithm}" in if_none_match for algorithm in current_app.config['COMPRESS_ALGORITHM']
+    )
+
+
+def _analytics_response(analytics, etag, cache_status):
+    if _etag_matches(etag):
+        return '', 304, {'ETag': quote_etag(etag), 'X-Cache': cache_status}
+    response = jsonify(analytics)
+    response.set_etag(etag)
+    response.headers['X-Cache'] = cache_status
+    return response, 200
+
+
+def _claim_etag(claim):
+    """Cheap ETag from claim_id + last modification time (no body serialization)"""
+    stamp = claim.get('updated_at') or claim.get('created_at')
+    if not stamp:
+        return None
+    return hashlib.blake2b(f"{claim['claim_id']}:{stamp.isoformat()}".encode(), digest_size=8).hexdigest()
+
+
 # ---------------------------------------------
 # 🧾 View All Claims
 # ---------------------------------------------
@@ -31,13 +101,13 @@ def admin_required(f):
 @admin_required
 def get_all_claims(current_user):
     try:
-        claims = list(db.claims.find({}))
-        for claim in claims:
-            claim['_id'] = str(claim['_id'])
-        return jsonify(claims), 200
+        # Streamed straight from the cursor - memory stays flat however many claims exist
+        claims = db.iter_all_claims(projection=CLAIM_LIST_PROJECTION)
+        body = current_app.json.stream_array(claims)
+        return Response(stream_with_context(body), mimetype='application/json'), 200
     except Exception as e:
         logger.error(f"Error fetching claims: {e}")
-        return jsonify({'error': 'Failed to fetch claims'}), 500
+        return error_response('Failed to fetch claims', 500)
 
 
 # ---------------------------------------------
@@ -50,12 +120,20 @@ def get_claim(current_user, claim_id):
     try:
         claim = db.claims.find_one({'claim_id': claim_id})
         if not claim:
-            return jsonify({'error': 'Claim not found'}), 404
-        claim['_id'] = str(claim['_id'])
-        return jsonify(claim), 200
+            return error_response('Claim not found', 404)
+        
+        # Unchanged since the client's last poll - skip serializing the body
+        etag = _claim_etag(claim)
+        if etag and _etag_matches(etag):
+            return '', 304, {'ETag': quote_etag(etag)}
+        
+        response = jsonify(claim)
+        if etag:
+            response.set_etag(etag)
+        return response, 200
     except Exception as e:
         logger.error(f"Error fetching claim: {e}")
-        return jsonify({'error': 'Failed to fetch claim details'}), 500
+        return error_response('Failed to fetch claim details', 500)
 
 
 # ---------------------------------------------
@@ -70,23 +148,27 @@ def update_claim_status(current_user, claim_id):
         new_status = data.get('status')
 
         if not new_status:
-            return jsonify({'error': 'Status field is required'}), 400
+            return error_response('Status field is required', 400)
 
+        now = datetime.utcnow()
         result = db.claims.update_one(
             {'claim_id': claim_id},
             {'$set': {
                 'status': new_status,
-                'approved_at': datetime.utcnow() if new_status == 'approved' else None
+                'approved_at': now if new_status == 'approved' else None,
+                'updated_at': now
             }}
         )
 
         if result.modified_count == 0:
-            return jsonify({'error': 'Claim not found or status unchanged'}), 404
+            return error_response('Claim not found or status unchanged', 404)
+        
+        invalidate_analytics_cache()
 
         return jsonify({'message': f'Claim status updated to {new_status}'}), 200
     except Exception as e:
         logger.error(f"Error updating claim status: {e}")
-        return jsonify({'error': 'Failed to update claim status'}), 500
+        return error_response('Failed to update claim status', 500)
 
 
 # ---------------------------------------------
@@ -96,73 +178,70 @@ def update_claim_status(current_user, claim_id):
 @token_required
 @admin_required
 def get_analytics(current_user):
-    """Generate detailed admin analytics"""
+    """Generate detailed admin analytics (cached for ANALYTICS_CACHE_TTL_SECONDS)"""
+    with _analytics_cache_lock:
+        cached = _analytics_cache.get('analytics')
+    if cached:
+        return _analytics_response(*cached, 'HIT')
+    
     try:
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
         
-        # Claims over time
         try:
-            pipeline = [
-                {'$match': {'created_at': {'$gte': thirty_days_ago}}},
-                {'$group': {
-                    '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
-                    'count': {'$sum': 1},
-                    'total_amount': {'$sum': '$amount'}
-                }},
-                {'$sort': {'_id': 1}}
-            ]
-            claims_over_time = list(db.claims.aggregate(pipeline))
+            # One $facet round-trip for all three metrics
+            summary = db.get_analytics_summary(thirty_days_ago)
+            claims_over_time = summary['claims_over_time']
+            fraud_distribution = summary['fraud_distribution']
+            approval_stats = summary['approval_statistics']
+            total_time = approval_stats['processing_seconds']
+            count = approval_stats['processed']
+            total_amount = approval_stats['total_amount']
         except Exception as e:
+            # Single-pass fallback over one projected fetch
             logger.warning(f"Aggregation fallback triggered: {e}")
-            from collections import defaultdict
-            all_claims = db.get_all_claims() if hasattr(db, 'get_all_claims') else []
-            filtered = [c for c in all_claims if c.get('created_at') and c['created_at'] >= thirty_days_ago]
             grouped = defaultdict(lambda: {'count': 0, 'total_amount': 0})
-            for c in filtered:
-                d = c['created_at'].strftime('%Y-%m-%d')
-                grouped[d]['count'] += 1
-                grouped[d]['total_amount'] += c.get('amount', 0)
+            risk_counts = Counter()
+            total_time = 0
+            count = 0
+            total_amount = 0
+            since_day = thirty_days_ago.strftime('%Y-%m-%d')
+            for c in db.get_all_claims(projection=ANALYTICS_FALLBACK_PROJECTION):
+                created_at = c.get('created_at')
+                d = created_at.strftime('%Y-%m-%d') if created_at else None
+                if d and d >= since_day:
+                    grouped[d]['count'] += 1
+                    grouped[d]['total_amount'] += c.get('amount', 0)
+                
+                risk_counts[c.get('ai_analysis', {}).get('risk_level')] += 1
+                
+                if c.get('status') != 'approved':
+                    continue
+                total_amount += c.get('amount', 0)
+                if created_at and c.get('approved_at'):
+                    total_time += (c['approved_at'] - created_at).total_seconds()
+                    count += 1
+            
             claims_over_time = [{'_id': k, **v} for k, v in sorted(grouped.items())]
+            fraud_distribution = {
+                'low': risk_counts['LOW'],
+                'medium': risk_counts['MEDIUM'],
+                'high': risk_counts['HIGH']
+            }
 
-        # Fraud distribution
-        try:
-            low_risk = db.claims.count_documents({'ai_analysis.risk_level': 'LOW'})
-            medium_risk = db.claims.count_documents({'ai_analysis.risk_level': 'MEDIUM'})
-            high_risk = db.claims.count_documents({'ai_analysis.risk_level': 'HIGH'})
-        except Exception:
-            all_claims = db.get_all_claims() if hasattr(db, 'get_all_claims') else []
-            low_risk = sum(1 for c in all_claims if c.get('ai_analysis', {}).get('risk_level') == 'LOW')
-            medium_risk = sum(1 for c in all_claims if c.get('ai_analysis', {}).get('risk_level') == 'MEDIUM')
-            high_risk = sum(1 for c in all_claims if c.get('ai_analysis', {}).get('risk_level') == 'HIGH')
-
-        # Average processing time
-        try:
-            approved_claims = list(db.claims.find({'status': 'approved'}))
-        except Exception:
-            approved_claims = db.get_all_claims() if hasattr(db, 'get_all_claims') else []
-            approved_claims = [c for c in approved_claims if c.get('status') == 'approved']
-
-        total_time = 0
-        count = 0
-        for c in approved_claims:
-            if c.get('created_at') and c.get('approved_at'):
-                total_time += (c['approved_at'] - c['created_at']).total_seconds()
-                count += 1
         avg_processing_time = round(total_time / count / 3600, 2) if count else 0
 
-        total_amount = sum(c.get('amount', 0) for c in approved_claims)
-
-        return jsonify({
+        analytics = {
             'claims_over_time': claims_over_time,
-            'fraud_distribution': {
-                'low': low_risk,
-                'medium': medium_risk,
-                'high': high_risk
-            },
+            'fraud_distribution': fraud_distribution,
             'average_processing_time_hours': avg_processing_time,
             'total_claims_amount': total_amount,
             'claims_processed': count
-        }), 200
+        }
+        etag = hashlib.blake2b(f"analytics:{time.time()}".encode(), digest_size=8).hexdigest()
+        with _analytics_cache_lock:
+            _analytics_cache['analytics'] = (analytics, etag)
+        
+        return _analytics_response(analytics, etag, 'MISS')
 
     except Exception as e:
         logger.error(f"Analytics error: {e}")
@@ -182,11 +261,19 @@ def get_analytics(current_user):
 @token_required
 @admin_required
 def get_all_users(current_user):
+    """
+    One page of users, newest first (passwords omitted).
+    Paginated: ?limit= (default USERS_PAGE_DEFAULT_LIMIT, max USERS_PAGE_MAX_LIMIT) and ?skip=.
+    X-Total-Count carries the total; keep requesting with skip += limit until skip >= total.
+    """
     try:
-        users = list(db.users.find({}, {'password': 0}))
-        for u in users:
-            u['_id'] = str(u['_id'])
-        return jsonify(users), 200
+        limit = min(max(request.args.get('limit', USERS_PAGE_DEFAULT_LIMIT, type=int), 1), USERS_PAGE_MAX_LIMIT)
+        skip = max(request.args.get('skip', 0, type=int), 0)
+        
+        users, total = db.get_users_page(skip=skip, limit=limit)
+        response = jsonify(users)
+        response.headers['X-Total-Count'] = str(total)
+        return response, 200
     except Exception as e:
         logger.error(f"Error fetching users: {e}")
-        return jsonify({'error': 'Failed to fetch users'}), 500
+        return error_response('Failed to fetch users', 500)
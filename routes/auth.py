@@ -1,15 +1,103 @@
 from flask import Blueprint, request, jsonify
 from models.database import db
+from utils.helpers import error_response
 from models.user import User
 import jwt
 import os
-from datetime import datetime, timedelta
+import time
+import hmac
+import base64
+import hashlib
 from functools import wraps
+from threading import Lock
+from cachetools import TTLCache
+from pymongo.errors import DuplicateKeyError
 import logging
 
 auth_bp = Blueprint('auth', __name__)
 logger = logging.getLogger(__name__)
 
+# Read once at import - fail fast instead of a 500 on every request
+_jwt_secret = os.getenv('JWT_SECRET')
+if not _jwt_secret:
+    logger.error("JWT_SECRET not configured!")
+    raise ValueError("JWT_SECRET is required but not set in .env")
+JWT_SECRET = _jwt_secret.encode()
+JWT_ALGORITHM = 'HS256'
+TOKEN_EXPIRATION_SECONDS = 7 * 24 * 3600  # 7 days, shared by JWTs and session tokens
+
+# Compact session tokens: "s1." + base64url(user_id:role:exp || mac)
+# JWTs always start with "eyJ", so the prefix is enough to tell them apart.
+SESSION_TOKEN_PREFIX = 's1.'
+SESSION_MAC_SIZE = 16
+
+# Failed-login throttle keyed by client IP + email
+MAX_FAILED_LOGINS = 5
+FAILED_LOGIN_WINDOW_SECONDS = 15 * 60
+_failed_logins = TTLCache(maxsize=10000, ttl=FAILED_LOGIN_WINDOW_SECONDS)
+_failed_logins_lock = Lock()
+
+
+# Validated tokens -> (current_user, expires_at); skips jwt.decode + user lookup.
+# Entries aren't invalidated: a role change or account disable made in the database
+# reaches already-cached tokens within TOKEN_CACHE_TTL_SECONDS.
+TOKEN_CACHE_TTL_SECONDS = 30
+_token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = Lock()
+
+
+def _token_cache_key(token):
+    # Hash so raw bearer tokens are never held in memory
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _record_failed_login(key):
+    with _failed_logins_lock:
+        _failed_logins[key] = _failed_logins.get(key, 0) + 1
+
+
+# Fixed-size BLAKE2b key derived from the JWT secret
+SESSION_KEY = hashlib.sha256(JWT_SECRET).digest()
+
+
+def _session_mac(payload):
+    return hashlib.blake2b(payload, key=SESSION_KEY, digest_size=SESSION_MAC_SIZE).digest()
+
+
+def create_session_token(user):
+    """Issue a compact keyed-BLAKE2b session token (cheaper to verify than a JWT)"""
+    exp = int(time.time()) + TOKEN_EXPIRATION_SECONDS
+    payload = f"{user['_id']}:{user['role']}:{exp}".encode()
+    raw = payload + _session_mac(payload)
+    return SESSION_TOKEN_PREFIX + base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_session_token(token):
+    """
+    Verify a compact session token and return its claims.
+    Raises the same PyJWT exceptions as jwt.decode so callers handle both alike.
+    """
+    body = token[len(SESSION_TOKEN_PREFIX):]
+    try:
+        raw = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+    except (ValueError, TypeError):
+        raise jwt.InvalidTokenError('Malformed session token')
+    
+    payload, mac = raw[:-SESSION_MAC_SIZE], raw[-SESSION_MAC_SIZE:]
+    if len(mac) != SESSION_MAC_SIZE or not hmac.compare_digest(mac, _session_mac(payload)):
+        raise jwt.InvalidSignatureError('Session token signature mismatch')
+    
+    try:
+        user_id, role, exp = payload.decode().split(':')
+        exp = int(exp)
+    except ValueError:
+        raise jwt.InvalidTokenError('Malformed session token')
+    
+    if exp < time.time():
+        raise jwt.ExpiredSignatureError('Session token has expired')
+    
+    return {'user_id': user_id, 'role': role, 'exp': exp}
+
 def token_required(f):
     """
     Decorator to protect routes
@@ -20,58 +108,71 @@ def token_required(f):
         token = request.headers.get('Authorization')
         
         if not token:
-            return jsonify({'error': 'Token is missing'}), 401
+            return error_response('Token is missing', 401)
+        
+        # Remove 'Bearer ' prefix if present
+        token = token.removeprefix('Bearer ')
+        
+        # Recently validated token - reuse the user without another DB hit
+        cache_key = _token_cache_key(token)
+        with _token_cache_lock:
+            cached = _token_cache.get(cache_key)
+        if cached and cached[1] > time.time():
+            return f(dict(cached[0]), *args, **kwargs)
         
         try:
-            # Remove 'Bearer ' prefix if present
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
-            # Validate JWT secret exists
-            jwt_secret = os.getenv('JWT_SECRET')
-            if not jwt_secret:
-                logger.error("JWT_SECRET not configured!")
-                return jsonify({'error': 'Server configuration error'}), 500
-            
-            # Decode token
-            data = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+            # Decode token (compact session token fast path, JWT otherwise)
+            if token.startswith(SESSION_TOKEN_PREFIX):
+                data = decode_session_token(token)
+            else:
+                data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+                
+                # CRITICAL FIX #6: Validate required fields in token
+                if 'email' not in data or 'user_id' not in data:
+                    return error_response('Invalid token structure', 401)
             
-            # CRITICAL FIX #6: Validate required fields in token
-            if 'email' not in data or 'user_id' not in data:
-                return jsonify({'error': 'Invalid token structure'}), 401
+            token_subject = data.get('email', data['user_id'])
             
             # Get user from database
             try:
-                current_user = db.get_user_by_email(data['email'])
+                if 'email' in data:
+                    current_user = db.get_user_by_email(data['email'])
+                else:
+                    current_user = db.get_user_by_id(data['user_id'])
             except Exception as e:
                 logger.error(f"Database error fetching user: {e}")
-                return jsonify({'error': 'Database error'}), 500
+                return error_response('Database error', 500)
             
             if not current_user:
-                return jsonify({'error': 'User not found'}), 401
+                return error_response('User not found', 401)
             
             # Check if user is active
             if not current_user.get('is_active', True):
-                return jsonify({'error': 'Account is disabled'}), 403
+                return error_response('Account is disabled', 403)
             
             # Verify user ID matches
-            if str(current_user['_id']) != data['user_id']:
-                logger.warning(f"Token user_id mismatch for {data['email']}")
-                return jsonify({'error': 'Invalid token'}), 401
+            if not hmac.compare_digest(str(current_user['_id']).encode(), str(data['user_id']).encode()):
+                logger.warning(f"Token user_id mismatch for {token_subject}")
+                return error_response('Invalid token', 401)
             
             # Optional: Check if role changed
-            if current_user.get('role') != data.get('role'):
-                logger.warning(f"User role changed since token issued: {data['email']}")
-                return jsonify({'error': 'Token expired - please login again'}), 401
+            if not hmac.compare_digest(str(current_user.get('role')).encode(), str(data.get('role')).encode()):
+                logger.warning(f"User role changed since token issued: {token_subject}")
+                return error_response('Token expired - please login again', 401)
+            
+            # Never cache past the token's own expiry. Cache a copy so a view that
+            # mutates current_user can't change what later requests see (hits copy too).
+            with _token_cache_lock:
+                _token_cache[cache_key] = (dict(current_user), data['exp'])
                 
         except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
+            return error_response('Token has expired', 401)
         except jwt.InvalidTokenError as e:
             logger.warning(f"Invalid token: {e}")
-            return jsonify({'error': 'Invalid token'}), 401
+            return error_response('Invalid token', 401)
         except Exception as e:
             logger.error(f"Token validation error: {e}")
-            return jsonify({'error': 'Token validation failed'}), 401
+            return error_response('Token validation failed', 401)
         
         return f(current_user, *args, **kwargs)
     
@@ -87,13 +188,9 @@ def register():
         # Validate input
         required_fields = ['email', 'password', 'name']
         if not all(field in data for field in required_fields):
-            return jsonify({'error': 'Missing required fields'}), 400
-        
-        # Check if user exists
-        if db.get_user_by_email(data['email']):
-            return jsonify({'error': 'Email already registered'}), 400
+            return error_response('Missing required fields', 400)
         
-        # Create user
+        # Create user (the unique email index rejects duplicates - no pre-read)
         user_data = User.create(
             email=data['email'],
             password=data['password'],
@@ -101,7 +198,10 @@ def register():
             role=data.get('role', 'customer')
         )
         
-        user_id = db.create_user(user_data)
+        try:
+            user_id = db.create_user(user_data)
+        except DuplicateKeyError:
+            return error_response('Email already registered', 400)
         
         return jsonify({
             'message': 'User registered successfully',
@@ -109,7 +209,7 @@ def register():
         }), 201
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(str(e), 500)
 
 
 @auth_bp.route('/login', methods=['POST'])
@@ -120,41 +220,57 @@ def login():
         
         # Validate input
         if not data.get('email') or not data.get('password'):
-            return jsonify({'error': 'Email and password required'}), 400
+            return error_response('Email and password required', 400)
+        
+        # Throttle before doing any password hashing work
+        throttle_key = f"{request.remote_addr}:{data['email']}"
+        with _failed_logins_lock:
+            failed_attempts = _failed_logins.get(throttle_key, 0)
+        if failed_attempts >= MAX_FAILED_LOGINS:
+            return error_response('Too many failed login attempts, try again later', 429)
         
         # Get user
         user = db.get_user_by_email(data['email'])
         
         if not user:
-            return jsonify({'error': 'Invalid credentials'}), 401
+            User.verify_dummy_password(data['password'])
+            _record_failed_login(throttle_key)
+            return error_response('Invalid credentials', 401)
         
         # Verify password
         if not User.verify_password(user['password'], data['password']):
-            return jsonify({'error': 'Invalid credentials'}), 401
+            _record_failed_login(throttle_key)
+            return error_response('Invalid credentials', 401)
         
-        # Generate JWT token
-        jwt_secret = os.getenv('JWT_SECRET')
-        if not jwt_secret:
-            logger.error("JWT_SECRET not configured!")
-            return jsonify({'error': 'Server configuration error'}), 500
+        with _failed_logins_lock:
+            _failed_logins.pop(throttle_key, None)
         
+        # Lazily migrate legacy werkzeug hashes to argon2
+        if User.needs_rehash(user['password']):
+            try:
+                db.update_user(user['_id'], {'password': User.hash_password(data['password'])})
+            except Exception as e:
+                logger.warning(f"Password rehash failed for {data['email']}: {e}")
+        
+        # Generate JWT token
         token = jwt.encode({
             'email': user['email'],
             'user_id': str(user['_id']),
             'role': user['role'],
-            'exp': datetime.utcnow() + timedelta(days=7)
-        }, jwt_secret, algorithm='HS256')
+            'exp': int(time.time()) + TOKEN_EXPIRATION_SECONDS
+        }, JWT_SECRET, algorithm=JWT_ALGORITHM)
         
         # Return user info
         user_info = User.to_dict(user)
         
         return jsonify({
             'token': token,
+            'session_token': create_session_token(user),
             'user': user_info
         }), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(str(e), 500)
 
 
 @auth_bp.route('/verify', methods=['GET'])
@@ -1,18 +1,47 @@
 from flask import Blueprint, request, jsonify
 from models.database import db
+from utils.helpers import error_response
 from models.claim import Claim
 from routes.auth import token_required
-from services.ai_service import ai_service
+from services.ai_service import get_ai_service
 from services.fraud_detector import fraud_detector
 from services.document_processor import document_processor
 import os
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 logger = logging.getLogger(__name__)
 
 claims_bp = Blueprint('claims', __name__)
 
+# Shared pool for overlapping the Gemini / DB calls made while creating a claim
+ai_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='claim-ai')
+
+# Document saves (disk write + image optimization) for one claim run side by side
+MAX_DOCUMENTS = 5
+# Whole multipart body: every document at the per-file limit plus form-field slack
+MAX_UPLOAD_REQUEST_SIZE = MAX_DOCUMENTS * document_processor.MAX_FILE_SIZE + 5 * 1024 * 1024
+document_executor = ThreadPoolExecutor(max_workers=MAX_DOCUMENTS, thread_name_prefix='claim-docs')
+
+# Upper bounds on waiting for each call (covers its own retries and backoff)
+EXTRACTION_TIMEOUT_SECONDS = 120
+AI_CHECK_TIMEOUT_SECONDS = 60
+
+# Accepted claim_type spellings -> canonical stored value
+CLAIM_TYPE_MAP = {
+    'health': 'Health',
+    'motor': 'Motor',
+    'vehicle': 'Motor',
+    'property': 'Property',
+}
+VALID_CLAIM_TYPES = frozenset(CLAIM_TYPE_MAP.values())
+CLAIM_TYPE_ERROR = f'Claim type must be one of: {", ".join(sorted(VALID_CLAIM_TYPES))}'
+POLICY_NUMBER_MIN_LENGTH = 5
+DESCRIPTION_MIN_LENGTH = 10
+DESCRIPTION_MAX_LENGTH = 2000
+ALLOWED_EXTENSIONS_TEXT = ', '.join(sorted(document_processor.ALLOWED_EXTENSIONS))
+
 @claims_bp.route('/create', methods=['POST'])
 @token_required
 def create_claim(current_user):
@@ -20,32 +49,38 @@ def create_claim(current_user):
     Create new insurance claim
     CRITICAL FIX #4: Added validation
     """
+    # Reject oversized bodies from the header alone, before anything is parsed
+    if request.content_length and request.content_length > MAX_UPLOAD_REQUEST_SIZE:
+        return error_response('Upload too large (max 5 documents of 10MB each)', 413)
+    
     try:
-        # Get form data with trimming
-        policy_number = request.form.get('policy_number', '').strip()
-        claim_type = request.form.get('claim_type', '').strip()
-        description = request.form.get('description', '').strip()
+        # Get form data with trimming (bind the parsed form once)
+        form = request.form
+        policy_number = (form.get('policy_number') or '').strip()
+        raw_claim_type = (form.get('claim_type') or '').strip()
+        claim_type = CLAIM_TYPE_MAP.get(raw_claim_type.lower())
+        description = (form.get('description') or '').strip()
         
         # CRITICAL FIX #4: Validate required fields
         validation_errors = []
         
         if not policy_number:
             validation_errors.append('Policy number is required')
-        elif len(policy_number) < 5:
-            validation_errors.append('Policy number must be at least 5 characters')
+        elif len(policy_number) < POLICY_NUMBER_MIN_LENGTH:
+            validation_errors.append(f'Policy number must be at least {POLICY_NUMBER_MIN_LENGTH} characters')
         
-        valid_claim_types = ['Health', 'Motor', 'Property']
-        if not claim_type:
+        if not raw_claim_type:
             validation_errors.append('Claim type is required')
-        elif claim_type not in valid_claim_types:
-            validation_errors.append(f'Claim type must be one of: {", ".join(valid_claim_types)}')
+        elif not claim_type:
+            validation_errors.append(CLAIM_TYPE_ERROR)
         
+        description_length = len(description)
         if not description:
             validation_errors.append('Description is required')
-        elif len(description) < 10:
-            validation_errors.append('Description must be at least 10 characters')
-        elif len(description) > 2000:
-            validation_errors.append('Description must be less than 2000 characters')
+        elif description_length < DESCRIPTION_MIN_LENGTH:
+            validation_errors.append(f'Description must be at least {DESCRIPTION_MIN_LENGTH} characters')
+        elif description_length > DESCRIPTION_MAX_LENGTH:
+            validation_errors.append(f'Description must be less than {DESCRIPTION_MAX_LENGTH} characters')
         
         if validation_errors:
             return jsonify({'error': 'Validation failed', 'details': validation_errors}), 400
@@ -54,11 +89,37 @@ def create_claim(current_user):
         uploaded_files = request.files.getlist('documents')
         
         if not uploaded_files or uploaded_files[0].filename == '':
-            return jsonify({'error': 'At least one document is required'}), 400
+            return error_response('At least one document is required', 400)
         
         # CRITICAL FIX #4: Validate file count and sizes
-        if len(uploaded_files) > 5:
-            return jsonify({'error': 'Maximum 5 documents allowed'}), 400
+        if len(uploaded_files) > MAX_DOCUMENTS:
+            return error_response('Maximum 5 documents allowed', 400)
+        
+        # Validate the whole batch before writing anything to disk.
+        # Size and content hash come from one read; identical files are saved once.
+        unique_files = []
+        unique_hashes = []
+        seen_hashes = set()
+        skipped_duplicates = []  # reported back so the client knows what wasn't stored
+        for file in uploaded_files:
+            if not document_processor.is_allowed_file(file.filename):
+                return error_response(f'File {file.filename} type not allowed. Allowed: {ALLOWED_EXTENSIONS_TEXT}', 400)
+            
+            if not document_processor.has_allowed_content(file):
+                return error_response(f'File {file.filename} content does not match its file type', 400)
+            
+            file_size, content_hash = document_processor.size_and_hash(file)
+            
+            if file_size > document_processor.MAX_FILE_SIZE:
+                return error_response(f'File {file.filename} exceeds 10MB limit', 400)
+            
+            if content_hash in seen_hashes:
+                logger.info(f"Skipping duplicate upload: {file.filename}")
+                skipped_duplicates.append(file.filename)
+                continue
+            seen_hashes.add(content_hash)
+            unique_files.append(file)
+            unique_hashes.append(content_hash)
         
         # Create initial claim
         claim_data = Claim.create(
@@ -68,55 +129,56 @@ def create_claim(current_user):
             description=description
         )
         
-        document_paths = []
-        total_size = 0
+        save_futures = [
+            document_executor.submit(document_processor.save_document, file, claim_data['claim_id'])
+            for file in unique_files
+        ]
+        save_results = [future.result() for future in save_futures]  # keeps upload order
         
-        for file in uploaded_files:
-            # Check individual file size
-            file.seek(0, 2)  # Move to end of file
-            file_size = file.tell()
-            file.seek(0)  # Reset file pointer
-            
-            total_size += file_size
-            
-            if file_size > 10 * 1024 * 1024:
-                # Clean up uploaded files if any
-                for path in document_paths:
-                    document_processor.delete_document(path)
-                return jsonify({'error': f'File {file.filename} exceeds 10MB limit'}), 400
-            
-            success, result = document_processor.save_document(file, claim_data['claim_id'])
-            
-            if not success:
-                for path in document_paths:
-                    document_processor.delete_document(path)
-                return jsonify({'error': result}), 400
-            
-            document_paths.append(result)
+        document_paths = [result for success, result in save_results if success]
+        save_error = next((result for success, result in save_results if not success), None)
+        
+        if save_error is not None:
+            # Clean up uploaded files if any
+            for path in document_paths:
+                document_processor.delete_document(path)
+            return error_response(save_error, 400)
         
         claim_data['documents'] = document_paths
         
-        # AI Processing with error handling
-        logger.info(f"Processing document with AI: {document_paths[0]}")
+        # AI Processing with error handling (first image document; Gemini can't read PDFs)
+        analysis_path, analysis_hash = next(
+            ((path, content_hash) for path, content_hash in zip(document_paths, unique_hashes)
+             if document_processor.is_image_file(path)),
+            (None, None)
+        )
         
         try:
-            ai_result = ai_service.extract_document_data(document_paths[0])
+            if analysis_path is None:
+                logger.info("No image document to analyze, skipping AI processing")
+                ai_result = {'success': False, 'error': 'No image document to analyze'}
+            else:
+                logger.info(f"Processing document with AI: {analysis_path}")
+                # Claim history doesn't depend on the document - fetch it during extraction
+                history_future = ai_executor.submit(fraud_detector.get_user_claim_history, str(current_user['_id']))
+                # Extraction, tampering and narrative checks share one Gemini call
+                analysis_future = ai_executor.submit(
+                    get_ai_service().analyze_document_full, analysis_path, description,
+                    content_hash=analysis_hash
+                )
+                ai_result = analysis_future.result(timeout=EXTRACTION_TIMEOUT_SECONDS)
             
             if ai_result['success']:
                 extracted_data = ai_result['data']
                 claim_data['ai_analysis']['extracted_data'] = extracted_data
+                claim_data['ai_analysis']['narrative_validation'] = ai_result['narrative_validation']
+                claim_data['ai_analysis']['tampering_check'] = ai_result['tampering_check']
                 claim_data['ai_analysis']['processed'] = True
                 
                 if extracted_data.get('claim_amount'):
                     claim_data['amount'] = extracted_data['claim_amount']
                 
-                validation_result = ai_service.validate_claim_narrative(description, extracted_data)
-                claim_data['ai_analysis']['narrative_validation'] = validation_result
-                
-                tampering_result = ai_service.detect_document_tampering(document_paths[0])
-                claim_data['ai_analysis']['tampering_check'] = tampering_result
-                
-                user_history = fraud_detector.get_user_claim_history(str(current_user['_id']))
+                user_history = history_future.result(timeout=AI_CHECK_TIMEOUT_SECONDS)
                 
                 fraud_analysis = fraud_detector.calculate_fraud_score(claim_data, user_history, extracted_data)
                 
@@ -147,7 +209,8 @@ def create_claim(current_user):
         
         return jsonify({
             'message': 'Claim created successfully',
-            'claim': Claim.to_dict(claim_data)
+            'claim': Claim.to_dict(claim_data),
+            'skipped_duplicates': skipped_duplicates
         }), 201
         
     except Exception as e:
@@ -2,8 +2,13 @@ from models.database import db
 from models.user import User
 from models.claim import Claim
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import BulkWriteError
 import random
 
+# Fixed seed so generated claim data is reproducible (claim IDs stay random)
+SEED_RANDOM_SEED = 42
+
 def seed_database():
     """Populate database with test data"""
     
@@ -16,37 +21,39 @@ def seed_database():
     # Create test users
     print("Creating users...")
     
-    # Admin user
-    admin_data = User.create(
-        email='admin@claimai.com',
-        password='admin123',
-        name='Admin User',
-        role='admin'
-    )
-    admin_data['phone'] = '+91 9876543210'
-    admin_id = db.create_user(admin_data)
-    print(f"✓ Admin created: admin@claimai.com")
-    
-    # Customer users
-    customers = [
-        {'email': 'customer1@test.com', 'password': 'pass123', 'name': 'Rajesh Kumar', 'phone': '+91 9123456789'},
-        {'email': 'customer2@test.com', 'password': 'pass123', 'name': 'Priya Sharma', 'phone': '+91 9234567890'},
-        {'email': 'customer3@test.com', 'password': 'pass123', 'name': 'Amit Patel', 'phone': '+91 9345678901'},
-        {'email': 'customer4@test.com', 'password': 'pass123', 'name': 'Sneha Reddy', 'phone': '+91 9456789012'},
+    # Admin first, then customers
+    users = [
+        {'email': 'admin@claimai.com', 'password': 'admin123', 'name': 'Admin User', 'phone': '+91 9876543210', 'role': 'admin'},
+        {'email': 'customer1@test.com', 'password': 'pass123', 'name': 'Rajesh Kumar', 'phone': '+91 9123456789', 'role': 'customer'},
+        {'email': 'customer2@test.com', 'password': 'pass123', 'name': 'Priya Sharma', 'phone': '+91 9234567890', 'role': 'customer'},
+        {'email': 'customer3@test.com', 'password': 'pass123', 'name': 'Amit Patel', 'phone': '+91 9345678901', 'role': 'customer'},
+        {'email': 'customer4@test.com', 'password': 'pass123', 'name': 'Sneha Reddy', 'phone': '+91 9456789012', 'role': 'customer'},
     ]
     
-    customer_ids = []
-    for cust in customers:
+    def build_user(user):
         user_data = User.create(
-            email=cust['email'],
-            password=cust['password'],
-            name=cust['name'],
-            role='customer'
+            email=user['email'],
+            password=user['password'],
+            name=user['name'],
+            role=user['role']
         )
-        user_data['phone'] = cust['phone']
-        user_id = db.create_user(user_data)
-        customer_ids.append(user_id)
-        print(f"✓ Customer created: {cust['email']}")
+        user_data['phone'] = user['phone']
+        return user_data
+    
+    # argon2 hashing runs in C without the GIL, so threads hash in parallel
+    with ThreadPoolExecutor() as pool:
+        users_data = list(pool.map(build_user, users))
+    
+    # The unique email index rejects a re-run - no pre-read needed
+    try:
+        user_ids = db.create_users(users_data)
+    except BulkWriteError:
+        print("⚠️ Seed users already exist - database is already seeded, skipping")
+        return
+    
+    customer_ids = user_ids[1:]
+    for user in users:
+        print(f"✓ {user['role'].capitalize()} created: {user['email']}")
     
     # Create sample claims
     print("\nCreating sample claims...")
@@ -144,14 +151,14 @@ def seed_database():
         },
     ]
     
-    for i, scenario in enumerate(claim_scenarios):
-        # Assign to random customer
-        user_id = random.choice(customer_ids)
-        
-        # Create claim with backdated timestamps for variety
-        days_ago = random.randint(1, 60)
-        created_date = datetime.utcnow() - timedelta(days=days_ago)
-        
+    # Draw owners and backdating offsets for every claim up front
+    rng = random.Random(SEED_RANDOM_SEED)
+    now = datetime.utcnow()
+    owners = rng.choices(customer_ids, k=len(claim_scenarios))
+    created_dates = [now - timedelta(days=rng.randint(1, 60)) for _ in claim_scenarios]
+    
+    claims_data = []
+    for scenario, user_id, created_date in zip(claim_scenarios, owners, created_dates):
         claim_data = Claim.create(
             user_id=user_id,
             policy_number=scenario['policy_number'],
@@ -178,7 +185,7 @@ def seed_database():
                 'policy_number': scenario['policy_number'],
                 'claim_amount': scenario['amount'],
                 'document_quality': 'clear',
-                'confidence_score': random.randint(75, 95)
+                'confidence_score': rng.randint(75, 95)
             },
             'processed': True
         }
@@ -186,14 +193,17 @@ def seed_database():
         # Add approval/rejection details
         if scenario['status'] == 'approved':
             claim_data['approved_amount'] = scenario['amount']
-            claim_data['approved_at'] = created_date + timedelta(days=random.randint(1, 7))
+            claim_data['approved_at'] = created_date + timedelta(days=rng.randint(1, 7))
             claim_data['admin_notes'] = 'Verified and approved after document review'
         elif scenario['status'] == 'rejected':
             claim_data['rejection_reason'] = 'Insufficient documentation'
-            claim_data['rejected_at'] = created_date + timedelta(days=random.randint(2, 10))
+            claim_data['rejected_at'] = created_date + timedelta(days=rng.randint(2, 10))
         
-        db.create_claim(claim_data)
-        print(f"✓ Claim created: {claim_data['claim_id']} - {scenario['claim_type']} - {scenario['status']}")
+        claims_data.append(claim_data)
+    
+    db.create_claims(claims_data)
+    for claim_data in claims_data:
+        print(f"✓ Claim created: {claim_data['claim_id']} - {claim_data['claim_type']} - {claim_data['status']}")
     
     print(f"\n✅ Database seeded successfully!")
     print(f"\n📋 Test Credentials:")
@@ -202,14 +212,20 @@ def seed_database():
     print(f"   Customer: customer2@test.com / pass123")
     print(f"\n🚀 Start server with: python app.py")
 
+# Amount thresholds, highest first; only the first matching label applies
+AMOUNT_RISK_LABELS = (
+    (500000, "High claim amount"),
+    (200000, "Above average claim amount"),
+)
+
 def generate_risk_factors(scenario):
     """Generate realistic risk factors"""
     factors = []
+    amount = scenario['amount']
     
-    if scenario['amount'] > 500000:
-        factors.append(f"High claim amount: ₹{scenario['amount']:,}")
-    elif scenario['amount'] > 200000:
-        factors.append(f"Above average claim amount: ₹{scenario['amount']:,}")
+    label = next((label for threshold, label in AMOUNT_RISK_LABELS if amount > threshold), None)
+    if label:
+        factors.append(f"{label}: ₹{amount:,}")
     
     if scenario['fraud_score'] > 70:
         factors.append("Multiple inconsistencies detected in documents")
@@ -217,7 +233,7 @@ def generate_risk_factors(scenario):
     if scenario['risk_level'] == 'HIGH':
         factors.append("Claim requires detailed investigation")
     
-    if scenario['claim_type'] == 'Motor' and scenario['amount'] > 500000:
+    if scenario['claim_type'] == 'Motor' and amount > 500000:
         factors.append("Total loss claim - vehicle verification needed")
     
     return factors
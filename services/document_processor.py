@@ -2,22 +2,97 @@ import os
 from werkzeug.utils import secure_filename
 from PIL import Image
 import io
+import hashlib
+import uuid
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+# Image re-encoding is CPU-bound, so it runs in a small per-worker process pool
+# instead of on request threads (or gevent's event loop)
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', 2))
+
 class DocumentProcessor:
     
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'tiff'}
+    # Leading magic bytes each extension's content must start with
+    FILE_SIGNATURES = {
+        'png': (b'\x89PNG\r\n\x1a\n',),
+        'jpg': (b'\xff\xd8\xff',),
+        'jpeg': (b'\xff\xd8\xff',),
+        'pdf': (b'%PDF-',),
+        'tiff': (b'II*\x00', b'MM\x00*'),
+    }
+    SIGNATURE_BYTES = 8
+    # Formats Gemini vision can read (PDFs go to manual review)
+    IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff'}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    CHUNK_SIZE = 64 * 1024  # 64KB
     UPLOAD_FOLDER = 'uploads'
+    MAX_IMAGE_DIMENSION = 2048
+    # Images already within the dimension cap and under this size are kept as uploaded
+    SKIP_REENCODE_BYTES = 500 * 1024  # 500KB
+    
+    # Re-encode settings per format. PNG optimize=True brute-forces zlib level 9
+    # over every filter (~13x slower than level 3 for ~10% smaller files)
+    SAVE_OPTIONS = {
+        'JPEG': {'optimize': True, 'quality': 85, 'progressive': True},
+        'PNG': {'compress_level': 3},
+    }
+    
+    # Upper bound on waiting for one image; the original upload is kept if exceeded
+    OPTIMIZE_TIMEOUT_SECONDS = 30
     
     def __init__(self):
         os.makedirs(self.UPLOAD_FOLDER, exist_ok=True)
+        self._image_pool = None
+        self._image_pool_lock = threading.Lock()
+    
+    def _get_image_pool(self):
+        # Created on first use so each gunicorn worker forks its own pool
+        with self._image_pool_lock:
+            if self._image_pool is None:
+                self._image_pool = ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS)
+            return self._image_pool
     
     def is_allowed_file(self, filename):
         """Check if file extension is allowed"""
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in self.ALLOWED_EXTENSIONS
     
+    def is_image_file(self, filename):
+        """Check if the file is an image (by extension; content was checked on upload)"""
+        return filename.rsplit('.', 1)[-1].lower() in self.IMAGE_EXTENSIONS
+    
+    def has_allowed_content(self, file):
+        """Check the file's magic bytes match its (allowed) extension, not just its name"""
+        extension = file.filename.rsplit('.', 1)[-1].lower()
+        header = file.read(self.SIGNATURE_BYTES)
+        file.seek(0)
+        return header.startswith(self.FILE_SIGNATURES.get(extension, ()))
+    
+    def size_and_hash(self, file):
+        """
+        Single chunked pass computing size and BLAKE2b content hash.
+        Stops early once the size limit is exceeded (hash is then None).
+        Returns: (file_size, content_hash)
+        """
+        h = hashlib.blake2b(digest_size=16)
+        total = 0
+        file.seek(0)
+        while True:
+            chunk = file.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > self.MAX_FILE_SIZE:
+                file.seek(0)
+                return total, None
+            h.update(chunk)
+        file.seek(0)
+        return total, h.hexdigest()
+    
     def save_document(self, file, claim_id):
         """
         Save uploaded document
@@ -31,22 +106,28 @@ class DocumentProcessor:
             if not self.is_allowed_file(file.filename):
                 return False, f"File type not allowed. Allowed: {', '.join(self.ALLOWED_EXTENSIONS)}"
             
-            # Check file size
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-            
-            if file_size > self.MAX_FILE_SIZE:
-                return False, "File too large (max 10MB)"
-            
-            # Generate unique filename
+            # Generate unique filename (random suffix: one claim's uploads are saved
+            # concurrently and often share a client name like image.jpg)
             timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
             original_filename = secure_filename(file.filename)
-            filename = f"{claim_id}_{timestamp}_{original_filename}"
+            filename = f"{claim_id}_{timestamp}_{uuid.uuid4().hex[:8]}_{original_filename}"
             
-            # Save file
+            # Stream to disk in fixed-size chunks, aborting once over the size limit
             file_path = os.path.join(self.UPLOAD_FOLDER, filename)
-            file.save(file_path)
+            written = 0
+            with open(file_path, 'wb') as out:
+                while True:
+                    chunk = file.stream.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > self.MAX_FILE_SIZE:
+                        break
+                    out.write(chunk)
+            
+            if written > self.MAX_FILE_SIZE:
+                self.delete_document(file_path)
+                return False, "File too large (max 10MB)"
             
             # Optimize image if it's an image
             if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
@@ -58,20 +139,53 @@ class DocumentProcessor:
             return False, f"Upload failed: {str(e)}"
     
     def _optimize_image(self, file_path):
-        """Compress and optimize image"""
+        """Compress and optimize image in the shared process pool"""
+        try:
+            future = self._get_image_pool().submit(_optimize_image_worker, file_path)
+            future.result(timeout=self.OPTIMIZE_TIMEOUT_SECONDS)
+        except BrokenProcessPool as e:
+            # A pool process died (e.g. OOM) - start a fresh pool next time
+            with self._image_pool_lock:
+                self._image_pool = None
+            print(f"Image optimization failed: {e}")
+        except Exception as e:
+            print(f"Image optimization failed: {e}")
+            # Continue anyway, file is already saved
+    
+    def _optimize_image_file(self, file_path):
+        """Compress and optimize image (runs inside a pool process)"""
         try:
-            img = Image.open(file_path)
+            img = Image.open(file_path)  # reads the header only; pixels decode lazily
+            
+            # Small and within bounds: re-encoding would only cost CPU and quality
+            if max(img.size) <= self.MAX_IMAGE_DIMENSION and os.path.getsize(file_path) < self.SKIP_REENCODE_BYTES:
+                img.close()
+                return
+            
+            # Phone cameras often write multi-picture JPEGs (MPO); keep only the primary image
+            image_format = 'JPEG' if img.format == 'MPO' else img.format
             
-            # Resize if too large
-            max_dimension = 2048
-            if max(img.size) > max_dimension:
-                img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            # Resize if too large (thumbnail decodes JPEGs at reduced scale via draft)
+            resized = max(img.size) > self.MAX_IMAGE_DIMENSION
+            if resized:
+                img.thumbnail((self.MAX_IMAGE_DIMENSION, self.MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
             
-            # Save optimized
-            img.save(file_path, optimize=True, quality=85)
+            # Save optimized to a temp file and swap it in atomically, so a crash
+            # mid-write never leaves a truncated document behind
+            tmp_path = file_path + '.tmp'
+            img.save(tmp_path, format=image_format, **self.SAVE_OPTIONS.get(image_format, {}))
+            img.close()
+            
+            # Same dimensions but no smaller (e.g. a PNG already compressed harder
+            # than compress_level 3): keep the original upload
+            if not resized and os.path.getsize(tmp_path) >= os.path.getsize(file_path):
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, file_path)
             
         except Exception as e:
             print(f"Image optimization failed: {e}")
+            self.delete_document(file_path + '.tmp')
             # Continue anyway, file is already saved
     
     def delete_document(self, file_path):
@@ -100,4 +214,9 @@ class DocumentProcessor:
         }
 
 # Singleton instance
-document_processor = DocumentProcessor()
\ No newline at end of file
+document_processor = DocumentProcessor()
+
+
+def _optimize_image_worker(file_path):
+    # Module-level so the process pool can pickle it
+    document_processor._optimize_image_file(file_path)
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from collections import Counter
 from models.database import db
 import random
 
@@ -10,6 +11,9 @@ class FraudDetector:
     MULTIPLE_CLAIMS_PERIOD = 180  # 6 months
     NEW_POLICY_PERIOD = 30  # days
     
+    # History checks only read these fields
+    HISTORY_PROJECTION = {'status': 1, 'created_at': 1, '_id': 0}
+    
     def calculate_fraud_score(self, claim_data, user_history, extracted_data):
         """
         Calculate fraud risk score (0-100)
@@ -88,8 +92,11 @@ class FraudDetector:
         if not user_history:
             return score, factors
         
+        # One pass over the history, no intermediate lists
+        status_counts = Counter(c['status'] for c in user_history)
+        
         # Multiple recent claims
-        recent_claims = len([c for c in user_history if c['status'] in ['approved', 'pending']])
+        recent_claims = status_counts['approved'] + status_counts['pending']
         
         if recent_claims >= 3:
             score += 25
@@ -99,7 +106,7 @@ class FraudDetector:
             factors.append("Multiple claims recently")
         
         # Check rejection history
-        rejected_claims = len([c for c in user_history if c['status'] == 'rejected'])
+        rejected_claims = status_counts['rejected']
         if rejected_claims > 0:
             score += 20
             factors.append(f"{rejected_claims} previously rejected claims")
@@ -195,10 +202,11 @@ class FraudDetector:
         """Get user's recent claim history"""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
+        # Range scan on the (user_id, created_at) index
         claims = db.claims.find({
             'user_id': user_id,
             'created_at': {'$gte': cutoff_date}
-        })
+        }, self.HISTORY_PROJECTION)
         
         return list(claims)
 
@@ -1,4 +1,6 @@
+from flask import jsonify
 from datetime import datetime
+import math
 import random
 import string
 
@@ -12,6 +14,23 @@ def format_currency(amount):
     """Format amount in INR"""
     return f"₹{amount:,.2f}"
 
+# Largest integer BSON can store (int64)
+BSON_INT64_MAX = 2 ** 63 - 1
+
+def normalize_amount(amount):
+    """
+    Round to paise and store whole-rupee amounts as int, so BSON keeps
+    them as int64 and $sum totals don't accumulate float drift.
+    Non-finite amounts become 0; amounts beyond int64 stay floats.
+    """
+    try:
+        amount = round(float(amount), 2)
+    except OverflowError:  # int too large for a float
+        return 0
+    if not math.isfinite(amount):
+        return 0
+    return int(amount) if amount.is_integer() and abs(amount) <= BSON_INT64_MAX else amount
+
 def calculate_days_difference(date1, date2):
     """Calculate days between two dates"""
     delta = date2 - date1
@@ -44,4 +63,8 @@ def truncate_text(text, max_length=100):
     """Truncate text with ellipsis"""
     if len(text) <= max_length:
         return text
-    return text[:max_length-3] + '...'
\ No newline at end of file
+    return text[:max_length-3] + '...'
+
+def error_response(message, status_code):
+    """Build the standard {'error': message} JSON response tuple"""
+    return jsonify({'error': message}), status_code
\ No newline at end of file
@@ -0,0 +1,55 @@
+from flask.json.provider import DefaultJSONProvider
+from bson import ObjectId
+import orjson
+
+_EMPTY = object()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson (C extension).
+    Output matches the default provider: sorted keys, and datetimes
+    rendered as HTTP dates through DefaultJSONProvider.default.
+    Mongo ObjectIds are emitted as strings, so documents can be returned as-is.
+    """
+    
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        return DefaultJSONProvider.default(o)
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def stream_array(self, items):
+        """
+        Encode an iterable as a JSON array one element at a time, so large
+        listings start sending before the whole result set is read.
+        The first element is pulled eagerly: errors surface before streaming starts.
+        """
+        items = iter(items)
+        first = next(items, _EMPTY)
+        
+        def generate():
+            if first is _EMPTY:
+                yield b'[]'
+                return
+            yield b'[' + orjson.dumps(first, default=self.default, option=self.option)
+            for item in items:
+                yield b',' + orjson.dumps(item, default=self.default, option=self.option)
+            yield b']'
+        
+        return generate()
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
@@ -1,26 +1,33 @@
 import re
 from datetime import datetime
 
+# Compiled once at import
+# Domain labels each end at a literal dot, so there is only one way to split
+# the input and matching stays linear (no backtracking blow-up)
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}')
+MAX_EMAIL_LENGTH = 254  # RFC 5321 path limit
+PHONE_PATTERN = re.compile(r'^[6-9]\d{9}$')
+# Assuming format: POL followed by 8-10 digits
+POLICY_NUMBER_PATTERN = re.compile(r'^POL\d{8,10}$')
+
 class Validators:
     
     @staticmethod
     def validate_email(email):
         """Validate email format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        if not email or len(email) > MAX_EMAIL_LENGTH:
+            return False
+        return EMAIL_PATTERN.fullmatch(email) is not None
     
     @staticmethod
     def validate_phone(phone):
         """Validate Indian phone number"""
-        pattern = r'^[6-9]\d{9}$'
-        return re.match(pattern, phone) is not None
+        return PHONE_PATTERN.match(phone) is not None
     
     @staticmethod
     def validate_policy_number(policy_number):
         """Validate policy number format"""
-        # Assuming format: POL followed by 8-10 digits
-        pattern = r'^POL\d{8,10}$'
-        return re.match(pattern, policy_number) is not None
+        return POLICY_NUMBER_PATTERN.match(policy_number) is not None
     
     @staticmethod
     def validate_claim_amount(amount):